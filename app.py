@@ -1,9 +1,23 @@
 import io
-import re
+import hashlib
+from functools import lru_cache, partial
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import streamlit as st
 import difflib
 
+try:
+    from rapidfuzz import fuzz, process as fuzz_process  # fuzzy matching kolom berbasis C++
+except ImportError:
+    fuzz = fuzz_process = None  # fallback: difflib
+
+try:
+    import python_calamine  # noqa: F401  (parser Excel berbasis Rust, dipakai via pandas engine="calamine")
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = None  # default pandas: openpyxl (.xlsx) / xlrd (.xls)
+
 st.set_page_config(page_title = "CSV/Excel Viewer + NIK Cleaner & Comparator", page_icon = "🧹", layout = "wide")
 st.title("🧹 CSV/Excel Viewer + NIK Cleaner & Comparator")
 st.markdown("""
@@ -23,19 +37,24 @@ st.markdown("""
          )
 
 # ---------- Utilitas ----------
-def only_digits(s):
-    """Ambil hanya digit (0-9) dari nilai apa pun."""
-    if s is None or (isinstance(s, float) and pd.isna(s)):
-        return ""
-    s = str(s)
-    return re.sub(r"[^0-9]", "", s)
-
-def normalize_nik(val):
-    """Normalisasi ke NIK valid (16 digit dan mulai '3'); jika tidak valid -> None."""
-    digits = only_digits(val)
-    if len(digits) == 16 and digits.startswith("3"):
-        return digits
-    return None
+def normalize_nik_series(s: pd.Series) -> pd.Series:
+    """Normalisasi satu kolom ke NIK valid (16 digit dan mulai '3', non-digit dibuang); tidak valid -> <NA>."""
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        # Kolom angka (umum dari Excel): 16 digit diawali '3' <=> 3e15 <= |v| < 4e15, cukup dua perbandingan.
+        # Juga menyelamatkan float64 (kolom angka ber-sel kosong) yang lewat str() jadi "....0" / "e+15".
+        v = s.abs()
+        mask = (v >= 3 * 10**15) & (v < 4 * 10**15) & (v % 1 == 0)
+        nik = pa.array(v.where(mask).astype("Int64")).cast(pa.string())  # int -> teks di kernel Arrow
+        return pd.Series(pd.array(nik, dtype = "string[pyarrow]"), index = s.index)
+    # string[pyarrow]: buffer UTF-8 kontigu, .str.* jalan di kernel Arrow (bukan objek str per sel)
+    digits = s.astype("string[pyarrow]").str.replace(r"[^0-9]", "", regex = True)
+    mask = (digits.str.len() == 16) & digits.str.startswith("3")
+    return digits.where(mask.fillna(False).astype(bool))
+
+def common_niks(nik_a, nik_b) -> pd.Index:
+    """Irisan dua array NIK unik; engine hash pd.Index dibangun sekali, di sisi yang lebih kecil."""
+    small, large = sorted((pd.Index(nik_a), pd.Index(nik_b)), key = len)
+    return large[small.get_indexer(large) >= 0]
 
 def default_index_for(cols, target_lower: str) -> int:
     """Cari index default untuk selectbox (dengan '<Tidak Ada>' di posisi 0)."""
@@ -45,49 +64,233 @@ def default_index_for(cols, target_lower: str) -> int:
     except ValueError:
         return 0
 
+CSV_ENCODINGS = ["utf-8", "utf-8-sig", "cp1252", "latin1"]
+NIK_COLUMN_NAMES = ["memberno", "identityno"]
+# Token default pd.read_csv (na_values / true_values / false_values), dipakai juga untuk parser pyarrow
+CSV_NA_VALUES = ["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+                 "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"]
+CSV_TRUE_VALUES = ["True", "TRUE", "true"]
+CSV_FALSE_VALUES = ["False", "FALSE", "false"]
+
+def _nik_columns(columns):
+    """Kolom bernama MemberNo/IdentityNo (case-insensitive) -> dibaca sebagai teks agar 16 digit utuh."""
+    return [c for c in columns if str(c).lower() in NIK_COLUMN_NAMES]
+
+def _read_csv_arrow(data: bytes, sep: str, encoding: str, use_header: bool, nik_cols):
+    """Parse CSV dengan pyarrow.csv (C++, multithread); kolom NIK langsung bertipe string.
+
+    Hasil harus sama dengan pd.read_csv; kasus yang berbeda dinormalkan di sini atau di-raise
+    agar _read_csv_cached jatuh ke pandas.
+    """
+    def read(column_types):
+        return pacsv.read_csv(io.BytesIO(data),
+                              read_options = pacsv.ReadOptions(encoding = encoding, autogenerate_column_names = not use_header),
+                              parse_options = pacsv.ParseOptions(delimiter = sep, newlines_in_values = True),
+                              convert_options = pacsv.ConvertOptions(column_types = column_types, strings_can_be_null = True,
+                                                                     null_values = CSV_NA_VALUES,
+                                                                     true_values = CSV_TRUE_VALUES, false_values = CSV_FALSE_VALUES))
+
+    column_types = {c: pa.string() for c in nik_cols}
+    table = read(column_types)
+    if any(pa.types.is_binary(t) for t in table.schema.types):
+        raise ValueError(f"Teks bukan {encoding} yang valid")  # pyarrow jatuh ke binary; coba encoding berikutnya
+    # pyarrow menebak tanggal/jam (date32, timestamp[tz=UTC], time32) sedangkan pandas membiarkannya teks;
+    # baca ulang kolom itu sebagai string agar isi unduhan sama & XLSX tidak gagal karena timezone
+    temporal = {f.name: pa.string() for f in table.schema if pa.types.is_temporal(f.type)}
+    if temporal:
+        if "" in temporal or len(set(table.column_names)) != len(table.column_names):
+            raise ValueError("Kolom tanggal tanpa nama unik")  # column_types dipetakan per nama header
+        table = read({**column_types, **temporal})
+    # Bilangan bulat di luar int64 jadi float64 (presisi hilang) di pyarrow, sedangkan pandas menyimpannya utuh
+    for f in table.schema:
+        if pa.types.is_floating(f.type):
+            v = table.column(f.name).to_numpy()
+            if ((abs(v) >= 2**53) & (v % 1 == 0)).any():
+                raise ValueError(f"Kolom {f.name!r} berisi bilangan bulat besar")
+    # Kolom kosong semua: pyarrow bertipe null (object None), pandas float64 NaN
+    for i, f in enumerate(table.schema):
+        if pa.types.is_null(f.type):
+            table = table.set_column(i, f.name, table.column(i).cast(pa.float64()))
+    # Header kosong → "Unnamed: {posisi}" seperti pandas
+    table = table.rename_columns([n if n else f"Unnamed: {i}" for i, n in enumerate(table.column_names)])
+    if len(set(table.column_names)) != len(table.column_names):
+        raise ValueError("Nama kolom duplikat")  # serahkan ke pandas (kolom ganda jadi .1, .2, ...)
+    df = table.to_pandas().astype({c: "string" for c in nik_cols})  # dtype sama dengan fallback pandas (NA = pd.NA)
+    if not use_header:
+        df.columns = range(df.shape[1])  # samakan dengan pandas header=None
+    return df
+
+@st.cache_data(show_spinner = False, max_entries = 8)
+def _read_csv_cached(data: bytes, sep: str, use_header: bool):
+    """Parse CSV dari bytes (coba beberapa encoding); di-cache per isi file + opsi baca."""
+    last_err = None
+    for enc in CSV_ENCODINGS:
+        try:
+            nik_cols = _nik_columns(pd.read_csv(io.BytesIO(data), sep = sep, encoding = enc, nrows = 0).columns) if use_header else []
+        except Exception as e:
+            last_err = e
+            continue
+        try:
+            return _read_csv_arrow(data, sep, enc, use_header, nik_cols)
+        except Exception as e:
+            last_err = e
+        try:
+            return pd.read_csv(io.BytesIO(data), sep = sep, encoding = enc, header = 0 if use_header else None,
+                               dtype = {c: "string" for c in nik_cols})
+        except Exception as e:
+            last_err = e
+    raise last_err
+
+@st.cache_data(show_spinner = False, max_entries = 8)
+def _excel_sheet_names(data: bytes):
+    """Daftar sheet workbook; di-cache per isi file."""
+    return pd.ExcelFile(io.BytesIO(data), engine = EXCEL_ENGINE).sheet_names
+
+@st.cache_data(show_spinner = False, max_entries = 8)
+def _read_excel_cached(data: bytes, sheet: str, use_header: bool):
+    """Parse satu sheet Excel dari bytes; di-cache per isi file + sheet + header."""
+    return pd.read_excel(io.BytesIO(data), engine = EXCEL_ENGINE, sheet_name = sheet, header = 0 if use_header else None)
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+def _frame_key(df):
+    """Kunci cache DataFrame dari kolom + dtype + isi penuh berurutan (hash bawaan Streamlit hanya sampling untuk frame besar)."""
+    # Hash per baris digabung sesuai urutan (bukan dijumlah) → frame yang sama tapi urutan baris beda dapat kunci beda
+    row_hashes = pd.util.hash_pandas_object(df, index = True).to_numpy()
+    return (tuple(map(str, df.columns)), tuple(map(str, df.dtypes)), df.shape, hashlib.sha1(row_hashes.tobytes()).hexdigest())
+
+@st.cache_data(show_spinner = False, max_entries = 12, hash_funcs = {pd.DataFrame: _frame_key})
+def to_csv_bytes(df, compression = None) -> bytes:
+    """CSV UTF-8 ber-BOM (ramah Excel), ditulis bertahap ke buffer biner tanpa string CSV utuh di memori.
+
+    compression="gzip" → .csv.gz (isi CSV sama persis, ukuran unduhan jauh lebih kecil).
+    """
+    buf = io.BytesIO()
+    if compression == "gzip":
+        compression = {"method": "gzip", "mtime": 0}  # mtime tetap → bytes deterministik
+    df.to_csv(buf, index = False, encoding = "utf-8-sig", compression = compression)
+    return buf.getvalue()
+
+@st.cache_data(show_spinner = False, max_entries = 12, hash_funcs = {pd.DataFrame: _frame_key})
+def to_excel_bytes(df, sheet_name: str) -> bytes:
+    """Tulis df ke XLSX via xlsxwriter (lebih cepat & hemat memori dari openpyxl)."""
+    buf = io.BytesIO()
+    # strings_to_urls=False: teks tetap teks (mis. PhotoUrl), sama seperti output openpyxl sebelumnya
+    with pd.ExcelWriter(buf, engine = "xlsxwriter", engine_kwargs = {"options": {"strings_to_urls": False}}) as writer:
+        df.to_excel(writer, index = False, sheet_name = sheet_name)
+    return buf.getvalue()
+
+@st.cache_data(show_spinner = False, max_entries = 12, hash_funcs = {pd.DataFrame: _frame_key})
+def to_parquet_bytes(df) -> bytes:
+    """Tulis df ke Parquet; kolom campuran (angka + teks) disimpan sebagai teks."""
+    buf = io.BytesIO()
+    try:
+        df.to_parquet(buf, index = False)
+    except (TypeError, ValueError):
+        buf = io.BytesIO()
+        safe = df.rename(columns = str)
+        safe = safe.astype({c: "string" for c in safe.select_dtypes(include = "object").columns})
+        safe.to_parquet(buf, index = False)
+    return buf.getvalue()
+
+def _session_memo(slot: str, key, compute):
+    """Simpan hasil terakhir per slot di st.session_state; pakai ulang objek yang sama selama key tidak berubah.
+
+    Untuk frame besar lebih murah dari cache_data yang meng-unpickle salinan baru di setiap rerun.
+    """
+    hit = st.session_state.get(slot)
+    if hit is not None and hit[0] == key:
+        return hit[1]
+    value = compute()
+    st.session_state[slot] = (key, value)
+    return value
+
 def load_dataframe(uploaded_file, prefix_key: str, use_header_default = True):
-    """Baca CSV/XLS/XLSX dengan UI delimiter/sheet terpisah per file."""
+    """Baca CSV/XLS/XLSX dengan UI delimiter/sheet terpisah per file → (df, source_key) atau (None, None)."""
     if uploaded_file is None:
-        return None
+        return None, None
 
     name = uploaded_file.name.lower()
     use_header = st.checkbox(f"[{prefix_key}] Baris pertama sebagai header", value = use_header_default, key = f"{prefix_key}_hdr")
+    data = uploaded_file.getvalue()  # bytes file jadi kunci cache parsing
+    file_hash = hashlib.sha1(data).hexdigest()
 
     if name.endswith(".csv"):
         delimiter = st.selectbox(f"[{prefix_key}] Delimiter CSV", options = [",", ";", "\t", "|"], index = 0, key = f"{prefix_key}_delim")
-        encodings = ["utf-8", "utf-8-sig", "cp1252", "latin1"]
-        last_err = None
-        df = None
-        for enc in encodings:
-            try:
-                uploaded_file.seek(0)
-                df = pd.read_csv(uploaded_file, sep = delimiter, encoding = enc, header = 0 if use_header else None)
-                break
-            except Exception as e:
-                last_err = e
-        if df is None and last_err:
-            st.error(f"[{prefix_key}] Gagal membaca CSV. Error terakhir: {last_err}")
-            return None
-        return df
+        try:
+            df = _session_memo(f"{prefix_key}_df", (file_hash, delimiter, use_header),
+                               lambda: _read_csv_cached(data, delimiter, use_header))
+        except Exception as e:
+            st.error(f"[{prefix_key}] Gagal membaca CSV. Error terakhir: {e}")
+            return None, None
+        read_opts = delimiter
 
     elif name.endswith(".xlsx") or name.endswith(".xls"):
         try:
-            uploaded_file.seek(0)
-            xl = pd.ExcelFile(uploaded_file)
-            sheet = st.selectbox(f"[{prefix_key}] Pilih sheet", options = xl.sheet_names, key = f"{prefix_key}_sheet")
-            df = xl.parse(sheet_name = sheet, header = 0 if use_header else None)
-            return df
+            sheet = st.selectbox(f"[{prefix_key}] Pilih sheet", options = _excel_sheet_names(data), key = f"{prefix_key}_sheet")
+            df = _session_memo(f"{prefix_key}_df", (file_hash, sheet, use_header),
+                               lambda: _read_excel_cached(data, sheet, use_header))
         except Exception as e:
             st.error(f"[{prefix_key}] Gagal membaca Excel: {e}")
-            return None
+            return None, None
+        read_opts = sheet
     else:
         st.error(f"[{prefix_key}] Ekstensi file tidak didukung.")
-        return None
+        return None, None
+
+    # Identitas isi df (file + opsi baca) untuk kunci cache tahap berikutnya, tanpa meng-hash DataFrame-nya.
+    # Dikembalikan terpisah (bukan df.attrs: attrs ikut ke frame turunan & tertulis ke metadata Parquet)
+    return df, (file_hash, read_opts, use_header)
+
+@st.cache_data(show_spinner = False, max_entries = 8)
+def _compute_clean(source_key, _df, member_col, identity_col, drop_dup: bool):
+    """Bagian komputasi clean_with_nik (tanpa UI): normalisasi NIK, saring baris valid, dedup.
 
-def clean_with_nik(df, prefix_key: str, title: str):
-    """Pilih kolom MemberNo/IdentityNo, bersihkan ke NIK valid, kembalikan df_clean + preview UI."""
+    _df tidak di-hash Streamlit (mahal untuk frame besar & hanya sampling >50rb baris);
+    cache di-key oleh source_key = (hash bytes file, opsi baca) yang dikembalikan load_dataframe.
+    """
+    # NIK final: prioritas MemberNo, lalu IdentityNo; tanpa salinan df/kolom bantu *_clean
+    nik = None
+    for col in (member_col, identity_col):
+        if col is not None:
+            cleaned = normalize_nik_series(_df[col])
+            nik = cleaned if nik is None else nik.combine_first(cleaned)
+
+    # Baris valid jika salah satu kolom menghasilkan NIK <=> NIK final tidak None
+    mask_valid = nik.notna()
+    df_clean = _df.loc[mask_valid].assign(NIK = nik[mask_valid])
+
+    # Letakkan NIK di depan
+    df_clean = df_clean[["NIK"] + [c for c in df_clean.columns if c != "NIK"]]
+
+    if drop_dup:
+        df_clean = df_clean.loc[~df_clean["NIK"].duplicated(keep = "first")]  # satu pass hashtable di kolom NIK saja
+
+    return df_clean
+
+@st.cache_data(show_spinner = False, max_entries = 8)
+def compare_nik(key_a, key_b, _df_a, _df_b):
+    """Set-ops NIK antar dua data bersih → (df_only_a, df_only_b, n_unik_a, n_unik_b, n_irisan).
+
+    Di-cache per pasangan clean_key (dari clean_with_nik), jadi rerun yang hanya menyentuh
+    widget lain tidak menghitung ulang unique/irisan/isin.
+    """
+    # NIK unik sebagai array (tanpa set Python), langsung dipakai isin
+    nik_a = _df_a["NIK"].dropna().unique()
+    nik_b = _df_b["NIK"].dropna().unique()
+
+    # Kedua mask cukup di-probe ke irisan (hashtable terkecil yang mungkin)
+    common = common_niks(nik_a, nik_b)
+    in_a = _df_b["NIK"].isin(common)  # baris Data Kab/Kota yang NIK-nya ada di Data Dispusipda
+    in_b = _df_a["NIK"].isin(common)  # baris Data Dispusipda yang NIK-nya ada di Data Kab/Kota
+
+    # NIK sudah di kolom pertama sejak _compute_clean → cukup satu boolean take per frame
+    return _df_a[~in_b], _df_b[~in_a], len(nik_a), len(nik_b), len(common)
+
+def clean_with_nik(df, source_key, prefix_key: str, title: str):
+    """Pilih kolom MemberNo/IdentityNo, bersihkan ke NIK valid, kembalikan (df_clean, clean_key) + preview UI."""
     if df is None:
-        return None
+        return None, None
 
     st.subheader(f"{title}")
     st.caption("Baris dianggap valid jika **salah satu** kolom menghasilkan NIK yang valid "
@@ -106,57 +309,31 @@ def clean_with_nik(df, prefix_key: str, title: str):
 
     if not do_clean or (member_col == "<Tidak Ada>" and identity_col == "<Tidak Ada>"):
         st.info("Aktifkan pembersihan dan pilih minimal satu kolom (MemberNo/IdentityNo).")
-        return None
-
-    work = df.copy()
-
-    # Hasil bersih per kolom
-    work["MemberNo_clean"] = work[member_col].apply(normalize_nik) if member_col != "<Tidak Ada>" else None
-    work["IdentityNo_clean"] = work[identity_col].apply(normalize_nik) if identity_col != "<Tidak Ada>" else None
+        return None, None
 
-    # Baris valid jika salah satu kolom *_clean tidak None
-    mask_valid = pd.Series(False, index = work.index)
-    if "MemberNo_clean" in work:
-        mask_valid = mask_valid | work["MemberNo_clean"].notna()
-    if "IdentityNo_clean" in work:
-        mask_valid = mask_valid | work["IdentityNo_clean"].notna()
-
-    df_clean = work.loc[mask_valid].copy()
-
-    # Kolom NIK final (prioritas MemberNo_clean, lalu IdentityNo_clean)
-    df_clean["NIK"] = df_clean.get("MemberNo_clean").combine_first(df_clean.get("IdentityNo_clean"))
-
-    # Letakkan NIK di depan, sembunyikan *_clean
-    front_cols = ["NIK"]
-    other_cols = [c for c in df_clean.columns if c not in front_cols and not str(c).endswith("_clean")]
-    df_clean = df_clean[front_cols + other_cols]
-
-    if drop_dup:
-        before = len(df_clean)
-        df_clean = df_clean.drop_duplicates(subset = ["NIK"], keep = "first")
-        removed_dups = before - len(df_clean)
-    else:
-        removed_dups = 0
+    member_col = None if member_col == "<Tidak Ada>" else member_col
+    identity_col = None if identity_col == "<Tidak Ada>" else identity_col
+    # clean_key: kunci cache untuk tahap perbandingan (compare_nik), tanpa perlu hash isi frame
+    clean_key = (source_key, member_col, identity_col, drop_dup)
+    df_clean = _session_memo(f"{prefix_key}_df_clean", clean_key,
+                             lambda: _compute_clean(source_key, df, member_col, identity_col, drop_dup))
 
     kept = len(df_clean)
-    dropped = int(len(work) - mask_valid.sum()) + removed_dups
     c1, c2, c3 = st.columns(3)
     c1.metric(f"[{prefix_key}] Baris Valid (kept)", kept)
-    c2.metric(f"[{prefix_key}] Baris Dibuang", dropped)
-    c3.metric(f"[{prefix_key}] Total Awal", len(work))
+    c2.metric(f"[{prefix_key}] Baris Dibuang", len(df) - kept)  # tidak valid + duplikat
+    c3.metric(f"[{prefix_key}] Total Awal", len(df))
 
     st.write(f"**Preview Data (SETELAH dibersihkan) – {prefix_key}**")
     st.dataframe(df_clean.head(30), use_container_width = True)
 
     # Unduh versi bersih (opsional)
-    csv_bytes = df_clean.to_csv(index = False).encode("utf-8-sig")
-    st.download_button(f"⬇️ Download {prefix_key} (bersih) - CSV", data = csv_bytes, file_name = f"{prefix_key.lower()}_cleaned.csv", mime = "text/csv", key = f"{prefix_key}_dl_csv")
-    buf = io.BytesIO()
-    with pd.ExcelWriter(buf, engine = "openpyxl") as writer:
-        df_clean.to_excel(writer, index = False, sheet_name = "cleaned")
-    st.download_button(f"⬇️ Download {prefix_key} (bersih) - XLSX", data = buf.getvalue(), file_name = f"{prefix_key.lower()}_cleaned.xlsx", mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", key = f"{prefix_key}_dl_xlsx")
+    st.download_button(f"⬇️ Download {prefix_key} (bersih) - CSV", data = partial(to_csv_bytes, df_clean), file_name = f"{prefix_key.lower()}_cleaned.csv", mime = "text/csv", key = f"{prefix_key}_dl_csv")
+    st.download_button(f"⬇️ Download {prefix_key} (bersih) - CSV.GZ", data = partial(to_csv_bytes, df_clean, "gzip"), file_name = f"{prefix_key.lower()}_cleaned.csv.gz", mime = "application/gzip", key = f"{prefix_key}_dl_csv_gz")
+    st.download_button(f"⬇️ Download {prefix_key} (bersih) - XLSX", data = partial(to_excel_bytes, df_clean, "cleaned"), file_name = f"{prefix_key.lower()}_cleaned.xlsx", mime = XLSX_MIME, key = f"{prefix_key}_dl_xlsx")
+    st.download_button(f"⬇️ Download {prefix_key} (bersih) - Parquet", data = partial(to_parquet_bytes, df_clean), file_name = f"{prefix_key.lower()}_cleaned.parquet", mime = "application/vnd.apache.parquet", key = f"{prefix_key}_dl_parquet")
 
-    return df_clean
+    return df_clean, clean_key
 
 # ---------- Upload kedua file ----------
 st.markdown("### 1) Upload File")
@@ -166,8 +343,8 @@ with colA:
 with colB:
     file_b = st.file_uploader("📂 Data Kab/Kota (CSV/XLS/XLSX)", type = ["csv", "xlsx", "xls"], key = "file_b")
 
-df_a = load_dataframe(file_a, "DataDispusipda") if file_a else None
-df_b = load_dataframe(file_b, "DataKab/Kota") if file_b else None
+df_a, key_a = load_dataframe(file_a, "DataDispusipda") if file_a else (None, None)
+df_b, key_b = load_dataframe(file_b, "DataKab/Kota") if file_b else (None, None)
 
 if df_a is not None:
     st.success("Data Dispusipda berhasil dibaca ✅")
@@ -175,9 +352,9 @@ if df_b is not None:
     st.success("Data Kab/Kota berhasil dibaca ✅")
 
 # ---------- Bersihkan masing-masing ----------
-df_a_clean = clean_with_nik(df_a, "DataDispusipda", "2) Pembersihan NIK – Data Dispusipda") if df_a is not None else None
+df_a_clean, clean_key_a = clean_with_nik(df_a, key_a, "DataDispusipda", "2) Pembersihan NIK – Data Dispusipda") if df_a is not None else (None, None)
 st.markdown("---")
-df_b_clean = clean_with_nik(df_b, "DataKab/Kota", "3) Pembersihan NIK – Data Kab/Kota") if df_b is not None else None
+df_b_clean, clean_key_b = clean_with_nik(df_b, key_b, "DataKab/Kota", "3) Pembersihan NIK – Data Kab/Kota") if df_b is not None else (None, None)
 
 # ---------- Perbandingan ----------
 st.markdown("---")
@@ -185,49 +362,31 @@ st.subheader("4) Perbandingan NIK antara Data Dispusipda vs Data Kab/Kota")
 if df_a_clean is None or df_b_clean is None:
     st.info("Unggah dan bersihkan **kedua** data terlebih dahulu untuk melakukan perbandingan.")
 else:
-    # Set NIK
-    nik_a = set(df_a_clean["NIK"].dropna().astype(str).unique())
-    nik_b = set(df_b_clean["NIK"].dropna().astype(str).unique())
-
-    only_in_b = nik_b - nik_a  # NIK yang hanya ada di Data Kab/kota
-    only_in_a = nik_a - nik_b  # NIK yang hanya ada di Data Dispusipda
+    df_only_a, df_only_b, n_a, n_b, n_common = compare_nik(clean_key_a, clean_key_b, df_a_clean, df_b_clean)
 
     st.write("**Ringkasan:**")
     c1, c2, c3 = st.columns(3)
-    c1.metric("NIK unik di Data Dispusipda", len(nik_a))
-    c2.metric("NIK unik di Data Kab/Kota", len(nik_b))
-    c3.metric("NIK sama (irisan)", len(nik_a & nik_b))
+    c1.metric("NIK unik di Data Dispusipda", n_a)
+    c2.metric("NIK unik di Data Kab/Kota", n_b)
+    c3.metric("NIK sama (irisan)", n_common)
 
     # Data Kab/Kota TIDAK dimiliki Data Dispusipda
     st.markdown("#### ➕ NIK hanya di **Data Kab/Kota** (tidak ada di Data Dispusipda)")
-    df_only_b = df_b_clean[df_b_clean["NIK"].isin(only_in_b)].copy()
-    # tampilkan NIK dulu
-    front_cols_b = ["NIK"]
-    other_cols_b = [c for c in df_only_b.columns if c not in front_cols_b]
-    df_only_b = df_only_b[front_cols_b + other_cols_b]
     st.dataframe(df_only_b.head(50), use_container_width=True)
 
-    csv_b = df_only_b.to_csv(index = False).encode("utf-8-sig")
-    st.download_button("⬇️ Download NIK hanya di Data Kab/Kota (CSV)", data = csv_b, file_name = "only_in_data_kab_kota.csv", mime = "text/csv", key = "dl_only_b_csv")
-    buf_b = io.BytesIO()
-    with pd.ExcelWriter(buf_b, engine = "openpyxl") as writer:
-        df_only_b.to_excel(writer, index = False, sheet_name = "only_in_kab_kota")
-    st.download_button("⬇️ Download NIK hanya di Data Kab/Kota (XLSX)", data = buf_b.getvalue(), file_name = "only_in_data_baru.xlsx", mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", key = "dl_only_b_xlsx")
+    st.download_button("⬇️ Download NIK hanya di Data Kab/Kota (CSV)", data = partial(to_csv_bytes, df_only_b), file_name = "only_in_data_kab_kota.csv", mime = "text/csv", key = "dl_only_b_csv")
+    st.download_button("⬇️ Download NIK hanya di Data Kab/Kota (CSV.GZ)", data = partial(to_csv_bytes, df_only_b, "gzip"), file_name = "only_in_data_kab_kota.csv.gz", mime = "application/gzip", key = "dl_only_b_csv_gz")
+    st.download_button("⬇️ Download NIK hanya di Data Kab/Kota (XLSX)", data = partial(to_excel_bytes, df_only_b, "only_in_kab_kota"), file_name = "only_in_data_baru.xlsx", mime = XLSX_MIME, key = "dl_only_b_xlsx")
+    st.download_button("⬇️ Download NIK hanya di Data Kab/Kota (Parquet)", data = partial(to_parquet_bytes, df_only_b), file_name = "only_in_data_kab_kota.parquet", mime = "application/vnd.apache.parquet", key = "dl_only_b_parquet")
 
     # Data Dispusipda TIDAK dimiliki Data Kab/Kota
     st.markdown("#### ➕ NIK hanya di **Data Dispusipda** (tidak ada di Data Kab/Kota)")
-    df_only_a = df_a_clean[df_a_clean["NIK"].isin(only_in_a)].copy()
-    front_cols_a = ["NIK"]
-    other_cols_a = [c for c in df_only_a.columns if c not in front_cols_a]
-    df_only_a = df_only_a[front_cols_a + other_cols_a]
     st.dataframe(df_only_a.head(50), use_container_width = True)
 
-    csv_a = df_only_a.to_csv(index = False).encode("utf-8-sig")
-    st.download_button("⬇️ Download NIK hanya di Data Dispusipda (CSV)", data = csv_a, file_name = "only_in_data_dispusipda.csv", mime = "text/csv", key = "dl_only_a_csv")
-    buf_a = io.BytesIO()
-    with pd.ExcelWriter(buf_a, engine = "openpyxl") as writer:
-        df_only_a.to_excel(writer, index = False, sheet_name = "only_in_dispusipda")
-    st.download_button("⬇️ Download NIK hanya di Data Dispusipda (XLSX)", data = buf_a.getvalue(), file_name = "only_in_data_dispusipda.xlsx", mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", key = "dl_only_a_xlsx")
+    st.download_button("⬇️ Download NIK hanya di Data Dispusipda (CSV)", data = partial(to_csv_bytes, df_only_a), file_name = "only_in_data_dispusipda.csv", mime = "text/csv", key = "dl_only_a_csv")
+    st.download_button("⬇️ Download NIK hanya di Data Dispusipda (CSV.GZ)", data = partial(to_csv_bytes, df_only_a, "gzip"), file_name = "only_in_data_dispusipda.csv.gz", mime = "application/gzip", key = "dl_only_a_csv_gz")
+    st.download_button("⬇️ Download NIK hanya di Data Dispusipda (XLSX)", data = partial(to_excel_bytes, df_only_a, "only_in_dispusipda"), file_name = "only_in_data_dispusipda.xlsx", mime = XLSX_MIME, key = "dl_only_a_xlsx")
+    st.download_button("⬇️ Download NIK hanya di Data Dispusipda (Parquet)", data = partial(to_parquet_bytes, df_only_a), file_name = "only_in_data_dispusipda.parquet", mime = "application/vnd.apache.parquet", key = "dl_only_a_parquet")
 
 # ---------- Standarisasi Tanpa Upload Mapping ----------
 st.markdown("---")
@@ -343,30 +502,56 @@ SYNONYMS = {"NO":                             ["ID"],
             "PHOTO URL":                      ["PhotoUrl", "Foto", "Photo"]
            }
 
-def _pick_source_col(df_src: pd.DataFrame, target_name: str, which: str):
-    """Ambil kolom sumber berdasar mapping → sinonim → fuzzy."""
+def _pick_source_col(target_name: str, which: str, columns: tuple, lower_map: dict):
+    """Ambil kolom sumber berdasar mapping → sinonim (fuzzy dikerjakan batch di _source_mapping)."""
     # 1) mapping builtin
     src = MAPPING_BUILTIN.get(target_name, {}).get(which, "")
-    if src and src in df_src.columns:
+    if src and src in columns:
         return src
 
-    # 2) sinonim (case-insensitive)
-    lower_map = {str(c).lower(): c for c in df_src.columns}
+    # 2) sinonim (case-insensitive, lookup O(1) ke dict yang dibangun sekali)
     for cand in SYNONYMS.get(target_name, [target_name]):
         if str(cand).lower() in lower_map:
             return lower_map[str(cand).lower()]
+    return None
 
-    # 3) fuzzy (nama template ke kolom sumber)
-    match = difflib.get_close_matches(target_name, [str(c) for c in df_src.columns], n = 1, cutoff = 0.85)
-    return match[0] if match else None
+def _fuzzy_matches(targets: list, names: list) -> dict:
+    """Fuzzy nama template → kolom sumber (difflib ratio >= 0.85) untuk semua target sekaligus."""
+    if not targets or not names:
+        return {}
+    if fuzz_process is None:
+        candidates = [names] * len(targets)
+    else:
+        # Saring kandidat dalam satu matriks skor di C (rapidfuzz). fuzz.ratio (LCS) selalu >= ratio difflib,
+        # jadi kolom yang lolos 0.85 di difflib pasti ada di sini; batas 84 memberi ruang pembulatan float32.
+        scores = fuzz_process.cdist(targets, names, scorer = fuzz.ratio, score_cutoff = 84)
+        candidates = [[names[j] for j in row.nonzero()[0]] for row in scores]
+    # Keputusan akhir tetap difflib (skor & tie-break sama persis) tapi hanya atas kandidat tersaring
+    out = {}
+    for tgt, cands in zip(targets, candidates):
+        match = difflib.get_close_matches(tgt, cands, n = 1, cutoff = 0.85) if cands else []
+        out[tgt] = match[0] if match else None
+    return out
+
+@lru_cache(maxsize = 32)
+def _source_mapping(columns: tuple, which: str) -> dict:
+    """Peta target template → kolom sumber; dihitung sekali per set kolom (bukan per rerun/per target)."""
+    lower_map = {str(c).lower(): c for c in columns}
+    mapping = {tgt: _pick_source_col(tgt, which, columns, lower_map) for tgt in TEMPLATE_ORDER}
+
+    # 3) fuzzy hanya untuk target yang belum ketemu
+    unresolved = [tgt for tgt, src in mapping.items() if src is None]
+    mapping.update(_fuzzy_matches(unresolved, [str(c) for c in columns]))
+    return mapping
 
 def _standardize(df_src: pd.DataFrame, which: str):
     """Bentuk dataframe baru persis TEMPLATE_ORDER, isi NA jika tidak ditemukan."""
-    out = pd.DataFrame()
-    for tgt in TEMPLATE_ORDER:
-        src_col = _pick_source_col(df_src, tgt, which)
-        out[tgt] = df_src[src_col] if (src_col and src_col in df_src.columns) else pd.NA
-    return out
+    mapping = _source_mapping(tuple(df_src.columns), which)
+    found = {tgt: src for tgt, src in mapping.items() if src and src in df_src.columns}
+    # Satu kali take kolom (satu kolom sumber boleh dipakai beberapa target), lalu satu reindex
+    out = df_src[list(found.values())]
+    out.columns = list(found.keys())
+    return out.reindex(columns = TEMPLATE_ORDER, fill_value = pd.NA)
 
 if (df_a_clean is not None) and (df_b_clean is not None):
     # Lihat kolom sumber untuk memudahkan mengedit mapping sekali saja
@@ -385,17 +570,15 @@ if (df_a_clean is not None) and (df_b_clean is not None):
     # Unduh versi standar
     cdl1, cdl2 = st.columns(2)
     with cdl1:
-        st.download_button("⬇️ Download Standar (Kab/Kota) - CSV", data = std_kab.to_csv(index = False).encode("utf-8-sig"), file_name = "only_in_data_kab_kota_standar.csv", mime = "text/csv", key = "dl_std_kab_csv")
-        buf1 = io.BytesIO()
-        with pd.ExcelWriter(buf1, engine = "openpyxl") as w:
-            std_kab.to_excel(w, index = False, sheet_name = "standar")
-        st.download_button("⬇️ Download Standar (Kab/Kota) - XLSX", data = buf1.getvalue(), file_name = "only_in_data_kab_kota_standar.xlsx", mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", key = "dl_std_kab_xlsx")
+        st.download_button("⬇️ Download Standar (Kab/Kota) - CSV", data = partial(to_csv_bytes, std_kab), file_name = "only_in_data_kab_kota_standar.csv", mime = "text/csv", key = "dl_std_kab_csv")
+        st.download_button("⬇️ Download Standar (Kab/Kota) - CSV.GZ", data = partial(to_csv_bytes, std_kab, "gzip"), file_name = "only_in_data_kab_kota_standar.csv.gz", mime = "application/gzip", key = "dl_std_kab_csv_gz")
+        st.download_button("⬇️ Download Standar (Kab/Kota) - XLSX", data = partial(to_excel_bytes, std_kab, "standar"), file_name = "only_in_data_kab_kota_standar.xlsx", mime = XLSX_MIME, key = "dl_std_kab_xlsx")
+        st.download_button("⬇️ Download Standar (Kab/Kota) - Parquet", data = partial(to_parquet_bytes, std_kab), file_name = "only_in_data_kab_kota_standar.parquet", mime = "application/vnd.apache.parquet", key = "dl_std_kab_parquet")
     with cdl2:
-        st.download_button("⬇️ Download Standar (Dispusipda) - CSV", data = std_disp.to_csv(index = False).encode("utf-8-sig"), file_name = "only_in_data_dispusipda_standar.csv", mime = "text/csv", key = "dl_std_disp_csv")
-        buf2 = io.BytesIO()
-        with pd.ExcelWriter(buf2, engine = "openpyxl") as w:
-            std_disp.to_excel(w, index = False, sheet_name = "standar")
-        st.download_button("⬇️ Download Standar (Dispusipda) - XLSX", data = buf2.getvalue(), file_name = "only_in_data_dispusipda_standar.xlsx", mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", key = "dl_std_disp_xlsx")
+        st.download_button("⬇️ Download Standar (Dispusipda) - CSV", data = partial(to_csv_bytes, std_disp), file_name = "only_in_data_dispusipda_standar.csv", mime = "text/csv", key = "dl_std_disp_csv")
+        st.download_button("⬇️ Download Standar (Dispusipda) - CSV.GZ", data = partial(to_csv_bytes, std_disp, "gzip"), file_name = "only_in_data_dispusipda_standar.csv.gz", mime = "application/gzip", key = "dl_std_disp_csv_gz")
+        st.download_button("⬇️ Download Standar (Dispusipda) - XLSX", data = partial(to_excel_bytes, std_disp, "standar"), file_name = "only_in_data_dispusipda_standar.xlsx", mime = XLSX_MIME, key = "dl_std_disp_xlsx")
+        st.download_button("⬇️ Download Standar (Dispusipda) - Parquet", data = partial(to_parquet_bytes, std_disp), file_name = "only_in_data_dispusipda_standar.parquet", mime = "application/vnd.apache.parquet", key = "dl_std_disp_parquet")
             
 # ---------- Watermark/Copyright ----------
 st.markdown(